@@ -55,7 +55,7 @@ async def ingest_textbook(
         processor = get_ade_processor()
         
         # Process PDF - returns [{"book_text": "...", "page_no": 1}, ...]
-        pages_data = processor.process_pdf(temp_path)
+        pages_data = await processor.process_pdf_async(temp_path)
         
         # Create textbook record with pages
         book_id = db.insert_textbook(
@@ -118,7 +118,7 @@ async def ingest_sow(
         # Use ADE processor to extract SOW
         from src.ingestion.ade_processor import get_ade_processor
         processor = get_ade_processor()
-        extraction = processor.extract_sow(temp_path)
+        extraction = await processor.extract_sow_async(temp_path)
         
         # Store the complete extraction as a single record
         sow_id = db.insert_sow_entry(
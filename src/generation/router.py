@@ -2,6 +2,7 @@
 Router - Context retrieval logic for lesson generation
 Uses SOW matcher for lesson-based page retrieval from book references
 """
+import json
 from typing import Dict, Any, List, Optional
 from src.models import Subject, LessonType
 from src.db.client import db
@@ -42,6 +43,18 @@ def normalize_grade(grade: str) -> str:
     return grade_str
 
 
+def _json_preview(obj: Any, limit: int = 1000) -> str:
+    """First `limit` chars of json.dumps(obj, indent=2), encoding only as much as needed."""
+    chunks = []
+    size = 0
+    for chunk in json.JSONEncoder(indent=2).iterencode(obj):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return "".join(chunks)[:limit]
+
+
 class ContextRouter:
     """Routes requests to appropriate content and retrieves context"""
 
@@ -119,8 +132,7 @@ class ContextRouter:
         print(f"   📄 [DEBUG] SOW grade_level: '{sow_data.get('grade_level')}'")
         print(f"   📄 [DEBUG] SOW file_name: {sow_data.get('file_name')}")
 
-        import json
-        extraction_preview = json.dumps(extraction, indent=2)[:1000]  # First 1000 chars
+        extraction_preview = _json_preview(extraction)  # First 1000 chars
         print(f"   📄 [DEBUG] Extraction preview:\n{extraction_preview}...")
         print()
 
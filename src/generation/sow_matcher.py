@@ -4,66 +4,111 @@ Supports both legacy teaching_sequence format and new structured format
 (recall / vocabulary / warm_up / exercises / differentiated_instruction / extension_activity).
 """
 import re
-from typing import Dict, List, Any, Optional, Tuple, Set
+from functools import lru_cache
+from typing import Dict, List, Any, Iterator, Optional, Tuple, Set
+
+
+# ============ PATTERNS ============
+
+# CW/HW page hints, e.g. "LB pgs. 110 – 111", "AB pg. 88-89", "ORT ... Pg 109 to 112"
+_PAGE_HINT_RANGE_RE = re.compile(
+    r'\b(LB|AB|ORT)\b.*?'               # book code
+    r'[Pp]gs?\.?\s*'                    # pg / pgs / Pg
+    r'(\d+)\s*(?:–|-|to)\s*(\d+)',      # range: 110 – 111
+    re.IGNORECASE
+)
+# Single-page hints, e.g. "LB pg 20" (used when the item gives no range for that book)
+_PAGE_HINT_SINGLE_RE = re.compile(
+    r'\b(LB|AB|ORT)\b.*?'
+    r'[Pp]g\.?\s*'
+    r'(\d+)(?!\s*(?:–|-|to)\s*\d)',
+    re.IGNORECASE
+)
+
+# Resources mentioned in free-text SOW content: audio tracks and YouTube links in one pass
+_RESOURCE_RE = re.compile(
+    r'(?P<track>[Aa]udio [Tt]rack\s+(?P<tnum>\d+))'
+    r'|(?P<url>https?://(?:www\.)?(?:youtube\.com|youtu\.be)/\S+)'
+)
+
+# CW/HW items that belong to the ORT book
+_ORT_MARK_RE = re.compile(r'ort|oxford reading', re.IGNORECASE)
+
+# Page mention inside teaching_sequence content, e.g. "pg. 12", "page 12", "p. 12"
+_PAGE_IN_CONTENT_RE = re.compile(r'\b(?:pg\.?\s*|page\s*|p\.\s*)(\d+)\b', re.IGNORECASE)
+
+# Book-tagged page references, e.g. "LB pg 10 to 12", "ORT pgs. #7-8", "AB 5"
+# group 3 is set only for ranges
+_PAGES_RE = re.compile(r'(LB|AB|TR|ORT)\s*(?:pgs?\.?\s*#?\s*)?(\d+)(?:\s*(?:to|–|-)\s*(\d+))?', re.IGNORECASE)
 
 
 # ============ UTILITIES ============
 
+# Book code → lesson section whose "pages" list gives that book's page coverage
+_COVERAGE_SECTIONS = {"ORT": "ort"}
+
+
 def get_lesson_page_coverage(lesson: Dict[str, Any]) -> Dict[str, List[int]]:
-    ort = lesson.get("ort", {})
-    ort_pages = ort.get("pages", [])
-    coverage: Dict[str, Set[int]] = {}
-    if ort_pages:
-        coverage["ORT"] = set(ort_pages)
-    return {k: sorted(list(v)) for k, v in coverage.items()}
+    coverage = {}
+    for book_type, section in _COVERAGE_SECTIONS.items():
+        pages = lesson.get(section, {}).get("pages")
+        if pages:
+            coverage[book_type] = sorted(set(pages))
+    return coverage
 
 
 ORT_LESSON_TYPES = {"reading", "reading_comprehension", "reading_decoding_fluency"}
 
 
+@lru_cache(maxsize=64)
 def is_ort_lesson_type(lesson_type: Optional[str]) -> bool:
     if not lesson_type:
         return False
     lt = lesson_type.lower()
-    return any(k in lt for k in ("ort", "reading"))
+    return "ort" in lt or "reading" in lt
 
 
 def parse_page_range(page_str: str) -> List[int]:
     if not page_str:
         return []
-    page_str = page_str.strip()
-    if "-" in page_str:
-        parts = page_str.split("-")
-        if len(parts) == 2:
-            try:
-                start = int(parts[0].strip())
-                end = int(parts[1].strip())
-                if start > end:
-                    print(f"   ⚠ [parse_page_range] Invalid range '{page_str}': start ({start}) > end ({end}) — likely a typo, returning empty.")
-                    return []
-                return list(range(start, end + 1))
-            except ValueError:
-                return []
-    try:
-        return [int(page_str)]
-    except ValueError:
+    # "110" or "110-112"; isdecimal() keeps int() from accepting "+5" or "1_0"
+    head, sep, tail = page_str.partition("-")
+    head = head.strip()
+    if not head.isdecimal():
         return []
+    start = int(head)
+    if not sep:
+        return [start]
+    tail = tail.strip()
+    if not tail.isdecimal():
+        return []
+    end = int(tail)
+    if start > end:
+        print(f"   ⚠ [parse_page_range] Invalid range '{page_str.strip()}': start ({start}) > end ({end}) — likely a typo, returning empty.")
+        return []
+    return list(range(start, end + 1))
 
 
-def find_lesson_by_number(sow_data: Dict[str, Any], lesson_number: int) -> Optional[Dict[str, Any]]:
+def _iter_lessons(sow_data: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Lazily yield (unit, lesson) pairs across the whole SOW."""
     curriculum = sow_data.get("curriculum", sow_data)
     for unit in curriculum.get("units", []):
         for lesson in unit.get("lessons", []):
-            if lesson.get("lesson_number") == lesson_number:
-                return {
-                    "unit_number": unit.get("unit_number", 0),
-                    "unit_title": unit.get("unit_title", ""),
-                    "lesson_number": lesson.get("lesson_number"),
-                    "lesson_title": lesson.get("lesson_title", ""),
-                    "lb_ab": lesson.get("lb_ab", {}),
-                    "ort": lesson.get("ort", {}),
-                    "classwork_homework": lesson.get("classwork_homework", [])
-                }
+            yield unit, lesson
+
+
+def find_lesson_by_number(sow_data: Dict[str, Any], lesson_number: int) -> Optional[Dict[str, Any]]:
+    for unit, lesson in _iter_lessons(sow_data):
+        if lesson.get("lesson_number") == lesson_number:
+            return {
+                "unit_number": unit.get("unit_number", 0),
+                "unit_title": unit.get("unit_title", ""),
+                "lesson_number": lesson.get("lesson_number"),
+                "lesson_title": lesson.get("lesson_title", ""),
+                "lb_ab": lesson.get("lb_ab", {}),
+                "ort": lesson.get("ort", {}),
+                "classwork_homework": lesson.get("classwork_homework", [])
+            }
     return None
 
 
@@ -81,25 +126,14 @@ def _extract_page_hints(classwork_homework: List[str]) -> Dict[str, str]:
          "Ex 2& 5LB pgs. 110 – 111"      →  {"LB": "110-111"}
     """
     hints: Dict[str, str] = {}
-    # Match patterns like "LB pgs. 110 – 111", "AB pg. 88-89", "ORT ... Pg 109 to 112"
-    pattern = re.compile(
-        r'\b(LB|AB|ORT)\b.*?'               # book code
-        r'[Pp]gs?\.?\s*'                    # pg / pgs / Pg
-        r'(\d+)\s*(?:–|-|to)\s*(\d+)',      # range: 110 – 111
-        re.IGNORECASE
-    )
-    single_pattern = re.compile(
-        r'\b(LB|AB|ORT)\b.*?'
-        r'[Pp]g\.?\s*'
-        r'(\d+)(?!\s*(?:–|-|to)\s*\d)',
-        re.IGNORECASE
-    )
+    # Per item, a range for a book wins over a single page for the same book.
+    # Two scans: a range match may start before a single-page mention and span it.
     for item in classwork_homework:
-        for m in pattern.finditer(item):
+        for m in _PAGE_HINT_RANGE_RE.finditer(item):
             code = m.group(1).upper()
             if code not in hints:
                 hints[code] = f"{m.group(2)}-{m.group(3)}"
-        for m in single_pattern.finditer(item):
+        for m in _PAGE_HINT_SINGLE_RE.finditer(item):
             code = m.group(1).upper()
             if code not in hints:
                 hints[code] = m.group(2)
@@ -160,24 +194,57 @@ def get_lesson_sections_summary(sow_data: Dict[str, Any], lesson_number: int) ->
 
 # ============ NEW FORMAT — RESOURCE EXTRACTION ============
 
-def _extract_resources_new_format(lb_ab: Dict[str, Any], selected_sections: Optional[Dict] = None) -> List[Dict[str, Any]]:
+def _harvest_resources(text: str, seen_tracks: Set[str], seen_urls: Set[str],
+                       resources: List[Dict[str, Any]]) -> None:
+    """
+    Append audio-track and YouTube resources mentioned in text.
+    Track numbers and URLs already in seen_tracks / seen_urls are skipped
+    before any resource strings are built.
+    """
+    track_add = seen_tracks.add
+    url_add = seen_urls.add
+    append = resources.append
+    for m in _RESOURCE_RE.finditer(text):
+        if m.lastgroup == "track":
+            num = m.group("tnum")
+            if num not in seen_tracks:
+                track_add(num)
+                append({"title": f"Audio Track {num}", "type": "audio", "reference": f"Track {num}"})
+        else:
+            url = m.group("url").rstrip(".,;)")
+            if url not in seen_urls:
+                url_add(url)
+                append({"title": "Video Resource", "type": "video", "reference": url})
+
+
+def _select_exercises(lb_ab: Dict[str, Any], selected_sections: Optional[Dict]) -> List[Dict[str, Any]]:
+    """Exercises whose id the teacher selected, in SOW order."""
+    selected_ex_ids: Set[str] = {str(i) for i in (selected_sections or {}).get("exercise_ids", [])}
+    if not selected_ex_ids:
+        return []
+    return [ex for ex in lb_ab.get("exercises", []) if str(ex.get("exercise_id")) in selected_ex_ids]
+
+
+def _extract_resources_new_format(lb_ab: Dict[str, Any], selected_sections: Optional[Dict] = None,
+                                  selected_exercises: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
     """Extract audio/video resources from new-format SOW based on selected sections."""
     resources = []
-    seen: Set = set()
+    seen_tracks: Set[str] = set()
+    seen_urls: Set[str] = set()
     ss = selected_sections or {}
-    selected_ex_ids = [str(i) for i in ss.get("exercise_ids", [])]
 
     def _add_audio(track_num):
-        ref = f"Track {track_num}"
-        if ref not in seen:
-            seen.add(ref)
-            resources.append({"title": f"Audio Track {track_num}", "type": "audio", "reference": ref})
+        num = str(track_num)
+        if num not in seen_tracks:
+            seen_tracks.add(num)
+            resources.append({"title": f"Audio Track {num}", "type": "audio", "reference": f"Track {num}"})
 
     def _add_video(url_str):
+        # digital_resource holds links, not prose — only YouTube tokens are collected
         for u in url_str.split():
             u = u.rstrip(".,;)")
-            if ("youtube" in u or "youtu.be" in u) and u not in seen:
-                seen.add(u)
+            if ("youtube" in u or "youtu.be" in u) and u not in seen_urls:
+                seen_urls.add(u)
                 resources.append({"title": "Video Resource", "type": "video", "reference": u})
 
     # Warm-up resources
@@ -187,10 +254,14 @@ def _extract_resources_new_format(lb_ab: Dict[str, Any], selected_sections: Opti
             if dr:
                 _add_video(dr)
 
-    # Exercise resources
-    for ex in lb_ab.get("exercises", []):
-        if selected_ex_ids and str(ex.get("exercise_id")) not in selected_ex_ids:
-            continue
+    # Exercise resources — all exercises when none were selected
+    if ss.get("exercise_ids"):
+        if selected_exercises is None:
+            selected_exercises = _select_exercises(lb_ab, ss)
+        exercises = selected_exercises
+    else:
+        exercises = lb_ab.get("exercises", [])
+    for ex in exercises:
         for sub in ex.get("sub_activities", []):
             t = sub.get("audio_track")
             if t:
@@ -205,33 +276,32 @@ def _extract_resources_new_format(lb_ab: Dict[str, Any], selected_sections: Opti
 # ============ NEW FORMAT — CONTEXT FORMATTER ============
 
 def _format_new_structure_for_prompt(lesson: Dict[str, Any], lb_ab: Dict[str, Any],
-                                     selected_sections: Optional[Dict]) -> str:
+                                     selected_sections: Optional[Dict],
+                                     selected_exercises: Optional[List[Dict[str, Any]]] = None) -> str:
     """
     Format new-format SOW content into a string for the LLM prompt.
     Shows selected vs not-selected sections clearly.
     """
     ss = selected_sections or {}
-    selected_ex_ids = [str(i) for i in ss.get("exercise_ids", [])]
+    if selected_exercises is None:
+        selected_exercises = _select_exercises(lb_ab, ss)
 
     recall = lb_ab.get("recall")
     vocabulary = lb_ab.get("vocabulary")
     warm_up = lb_ab.get("warm_up")
-    exercises_list = lb_ab.get("exercises", [])
     diff = lb_ab.get("differentiated_instruction")
     ext = lb_ab.get("extension_activity")
 
     parts = []
+    add = parts.append
 
     # Header
-    parts.append(f"**{lesson['unit_number']}. {lesson['unit_title']}**")
-    parts.append(f"Lesson {lesson['lesson_number']}: {lesson['lesson_title']}")
-    parts.append("")
+    add(f"**{lesson['unit_number']}. {lesson['unit_title']}**")
+    add(f"Lesson {lesson['lesson_number']}: {lesson['lesson_title']}")
+    add("")
 
     # Selections summary
-    ex_titles = []
-    for ex in exercises_list:
-        if str(ex.get("exercise_id")) in selected_ex_ids:
-            ex_titles.append(ex.get("title", ""))
+    ex_titles = [ex.get("title", "") for ex in selected_exercises]
     sel_parts = []
     sel_parts.append("✓ Recall" if ss.get("recall") else "✗ Recall")
     sel_parts.append("✓ Vocabulary" if ss.get("vocabulary") else "✗ Vocabulary")
@@ -243,118 +313,117 @@ def _format_new_structure_for_prompt(lesson: Dict[str, Any], lb_ab: Dict[str, An
     sel_parts.append("✓ Differentiated" if ss.get("differentiated") else "✗ Differentiated (LLM will create)")
     sel_parts.append("✓ Extension" if ss.get("extension") else "✗ Extension (do NOT include)")
     sel_parts.append("✓ Classwork" if ss.get("classwork") else "✗ Classwork (do NOT include C.W section)")
-    parts.append("TEACHER SELECTIONS: " + " | ".join(sel_parts))
-    parts.append("")
+    add("TEACHER SELECTIONS: " + " | ".join(sel_parts))
+    add("")
 
     # Available SLOs and Skills (LLM picks relevant ones)
     slos = lb_ab.get("slos", [])
     skills = lb_ab.get("skills", [])
     if slos:
-        parts.append("AVAILABLE SLOs (pick 2-4 relevant to selected sections):")
-        for s in slos:
-            parts.append(f"  • {s}")
-        parts.append("")
+        add("AVAILABLE SLOs (pick 2-4 relevant to selected sections):")
+        parts.extend(f"  • {s}" for s in slos)
+        add("")
     if skills:
-        parts.append("AVAILABLE SKILLS (pick 2-4 most actively exercised):")
-        parts.append(f"  {', '.join(skills)}")
-        parts.append("")
+        add("AVAILABLE SKILLS (pick 2-4 most actively exercised):")
+        add(f"  {', '.join(skills)}")
+        add("")
 
     # RECALL
     if ss.get("recall") and recall:
-        parts.append("## RECALL / RECAP")
-        parts.append(f"Title: {recall.get('title', '')}")
-        parts.append(recall.get("description", ""))
+        add("## RECALL / RECAP")
+        add(f"Title: {recall.get('title', '')}")
+        add(recall.get("description", ""))
         if recall.get("afl_strategies"):
-            parts.append(f"AFL: {', '.join(recall['afl_strategies'])}")
-        parts.append("")
+            add(f"AFL: {', '.join(recall['afl_strategies'])}")
+        add("")
 
     # VOCABULARY
     if ss.get("vocabulary") and vocabulary:
-        parts.append("## VOCABULARY")
+        add("## VOCABULARY")
         words = vocabulary.get("words", [])
         if words:
-            parts.append(f"Words: {', '.join(words)}")
-        for act in vocabulary.get("activities", []):
-            if not act.get("optional", False):
-                parts.append(f"Activity — {act.get('title', '')}: {act.get('description', '')}")
-        parts.append("")
+            add(f"Words: {', '.join(words)}")
+        parts.extend(
+            f"Activity — {act.get('title', '')}: {act.get('description', '')}"
+            for act in vocabulary.get("activities", [])
+            if not act.get("optional", False)
+        )
+        add("")
 
     # WARM-UP
     if ss.get("warmup") and warm_up:
-        parts.append("## WARM-UP")
+        add("## WARM-UP")
         for act in warm_up.get("activities", []):
-            parts.append(f"• {act.get('title', '')}: {act.get('description', '')}")
-            dr = act.get("digital_resource", "")
+            act_get = act.get
+            add(f"• {act_get('title', '')}: {act_get('description', '')}")
+            dr = act_get("digital_resource", "")
             if dr:
-                parts.append(f"  [Digital resource: {dr}]")
-            if act.get("afl_strategies"):
-                parts.append(f"  AFL: {', '.join(act['afl_strategies'])}")
+                add(f"  [Digital resource: {dr}]")
+            afl = act_get("afl_strategies")
+            if afl:
+                add(f"  AFL: {', '.join(afl)}")
         if warm_up.get("afl_strategies"):
-            parts.append(f"Overall AFL: {', '.join(warm_up['afl_strategies'])}")
-        parts.append("")
+            add(f"Overall AFL: {', '.join(warm_up['afl_strategies'])}")
+        add("")
 
     # EXERCISES (selected ones, in order)
-    if selected_ex_ids:
-        parts.append("## EXERCISES TO COVER")
-        parts.append("(Each exercise below MUST become its own <h2> section in the LP, using the exact exercise title)")
-        parts.append("")
-        for ex in exercises_list:
-            if str(ex.get("exercise_id")) not in selected_ex_ids:
-                continue
-            parts.append(f"--- EXERCISE: \"{ex.get('title', '')}\" ---")
+    if ss.get("exercise_ids"):
+        add("## EXERCISES TO COVER")
+        add("(Each exercise below MUST become its own <h2> section in the LP, using the exact exercise title)")
+        add("")
+        for ex in selected_exercises:
+            add(f"--- EXERCISE: \"{ex.get('title', '')}\" ---")
             for sub in ex.get("sub_activities", []):
-                parts.append(f"  Sub-activity: {sub.get('title', '')}")
-                parts.append(f"  {sub.get('description', '')}")
-                t = sub.get("audio_track")
+                sub_get = sub.get
+                add(f"  Sub-activity: {sub_get('title', '')}")
+                add(f"  {sub_get('description', '')}")
+                t = sub_get("audio_track")
                 if t:
-                    parts.append(f"  [Audio Track {t}]")
-                dr = sub.get("digital_resource", "")
+                    add(f"  [Audio Track {t}]")
+                dr = sub_get("digital_resource", "")
                 if dr:
-                    parts.append(f"  [Resource: {dr}]")
-                if sub.get("afl_strategies"):
-                    parts.append(f"  AFL: {', '.join(sub['afl_strategies'])}")
-                parts.append("")
+                    add(f"  [Resource: {dr}]")
+                afl = sub_get("afl_strategies")
+                if afl:
+                    add(f"  AFL: {', '.join(afl)}")
+                add("")
             if ex.get("afl_strategies"):
-                parts.append(f"  Exercise AFL: {', '.join(ex['afl_strategies'])}")
-            parts.append("")
+                add(f"  Exercise AFL: {', '.join(ex['afl_strategies'])}")
+            add("")
 
     # DIFFERENTIATED INSTRUCTION (struggling learners only)
     if ss.get("differentiated"):
-        parts.append("## DIFFERENTIATED INSTRUCTION")
+        add("## DIFFERENTIATED INSTRUCTION")
         if diff and diff.get("description"):
-            parts.append("(From SOW — use this content for struggling learners:)")
-            parts.append(diff.get("description", ""))
+            add("(From SOW — use this content for struggling learners:)")
+            add(diff.get("description", ""))
         else:
-            parts.append("(Not in SOW — create an appropriate scaffold for struggling learners:)")
-            parts.append("  Struggling: sentence frames / word banks / picture support")
-        parts.append("")
+            add("(Not in SOW — create an appropriate scaffold for struggling learners:)")
+            add("  Struggling: sentence frames / word banks / picture support")
+        add("")
 
     # EXTENSION ACTIVITY
     if ss.get("extension"):
-        parts.append("## EXTENSION ACTIVITY")
+        add("## EXTENSION ACTIVITY")
         if ext and ext.get("description"):
-            parts.append("(From SOW — use this content:)")
-            parts.append(ext.get("description", ""))
+            add("(From SOW — use this content:)")
+            add(ext.get("description", ""))
         else:
-            parts.append("(Not in SOW — create an appropriate extension based on lesson content)")
-        parts.append("")
+            add("(Not in SOW — create an appropriate extension based on lesson content)")
+        add("")
 
     # CLASSWORK / HOMEWORK — only include if teacher selected C.W, filter ORT items when ORT not selected
     include_ort_cwhw = ss.get("_has_ort", True)
     cw_hw = lesson.get("classwork_homework", [])
     if cw_hw and ss.get("classwork"):
-        filtered_cw_hw = []
-        for item in cw_hw:
-            item_lower = item.lower()
-            is_ort_item = "ort" in item_lower or "oxford reading" in item_lower
-            if is_ort_item and not include_ort_cwhw:
-                continue
-            filtered_cw_hw.append(item)
+        if include_ort_cwhw:
+            filtered_cw_hw = cw_hw
+        else:
+            filtered_cw_hw = [item for item in cw_hw if not _ORT_MARK_RE.search(item)]
         if filtered_cw_hw:
-            parts.append("## CLASSWORK / HOMEWORK (from SOW)")
-            for item in filtered_cw_hw:
-                parts.append(f"  {item}")
-            parts.append("")
+            add("## CLASSWORK / HOMEWORK (from SOW)")
+            parts.extend(f"  {item}" for item in filtered_cw_hw)
+            add("")
 
     return "\n".join(parts)
 
@@ -395,21 +464,12 @@ def get_lesson_context_by_number(
 
         # Build external resources from old-style content scan
         external_resources = []
-        seen_refs: Set = set()
+        seen_tracks: Set[str] = set()
+        seen_urls: Set[str] = set()
         reading_stages = section.get("reading_stages", {})
         for stage_name, stage in reading_stages.items():
             for act in stage.get("activities", []):
-                desc = act.get("description", "")
-                for m in re.finditer(r'[Aa]udio [Tt]rack\s+(\d+)', desc):
-                    ref = f"Track {m.group(1)}"
-                    if ref not in seen_refs:
-                        seen_refs.add(ref)
-                        external_resources.append({"title": f"Audio Track {m.group(1)}", "type": "audio", "reference": ref})
-                for m in re.finditer(r'https?://(?:www\.)?(?:youtube\.com|youtu\.be)/\S+', desc):
-                    url = m.group(0).rstrip(".,;)")
-                    if url not in seen_refs:
-                        seen_refs.add(url)
-                        external_resources.append({"title": "Video Resource", "type": "video", "reference": url})
+                _harvest_resources(act.get("description", ""), seen_tracks, seen_urls, external_resources)
 
         return {
             "found": True,
@@ -441,7 +501,8 @@ def get_lesson_context_by_number(
 
     if _is_new_format(section):
         # ─── NEW FORMAT ───
-        external_resources = _extract_resources_new_format(section, selected_sections)
+        selected_exercises = _select_exercises(section, selected_sections)
+        external_resources = _extract_resources_new_format(section, selected_sections, selected_exercises)
         return {
             "found": True,
             "unit": f"Unit {lesson['unit_number']}: {lesson['unit_title']}",
@@ -456,6 +517,7 @@ def get_lesson_context_by_number(
             "external_resources": external_resources,
             "exercise_step_indices": [],
             "selected_sections": selected_sections,
+            "selected_exercises": selected_exercises,
             "lb_ab_raw": section,             # raw section for formatter
             "lesson_raw": lesson,             # raw lesson for formatter
             "book_references": [],
@@ -465,19 +527,10 @@ def get_lesson_context_by_number(
         # ─── LEGACY FORMAT (teaching_sequence) ───
         full_teaching_sequence = section.get("teaching_sequence", [])
         external_resources = []
-        seen_refs: Set = set()
+        seen_tracks: Set[str] = set()
+        seen_urls: Set[str] = set()
         for step in full_teaching_sequence:
-            content = step.get("content", "")
-            for m in re.finditer(r'[Aa]udio [Tt]rack\s+(\d+)', content):
-                ref = f"Track {m.group(1)}"
-                if ref not in seen_refs:
-                    seen_refs.add(ref)
-                    external_resources.append({"title": f"Audio Track {m.group(1)}", "type": "audio", "reference": ref})
-            for m in re.finditer(r'https?://(?:www\.)?(?:youtube\.com|youtu\.be)/\S+', content):
-                url = m.group(0).rstrip(".,;)")
-                if url not in seen_refs:
-                    seen_refs.add(url)
-                    external_resources.append({"title": "Video Resource", "type": "video", "reference": url})
+            _harvest_resources(step.get("content", ""), seen_tracks, seen_urls, external_resources)
 
         teaching_sequence = full_teaching_sequence
         pages_found_in_sow = True
@@ -490,12 +543,12 @@ def get_lesson_context_by_number(
 
         exercise_step_indices = set()
         if exercises_text:
-            names = [e.strip().lower() for e in exercises_text.split(',') if e.strip()]
-            for i, step in enumerate(teaching_sequence):
-                s = step.get("strategy", "").lower()
-                c = step.get("content", "").lower()
-                if any(n in s or n in c for n in names):
-                    exercise_step_indices.add(i)
+            names = [e.strip() for e in exercises_text.split(',') if e.strip()]
+            if names:
+                names_re = re.compile("|".join(map(re.escape, names)), re.IGNORECASE)
+                for i, step in enumerate(teaching_sequence):
+                    if names_re.search(step.get("strategy", "") + "\n" + step.get("content", "")):
+                        exercise_step_indices.add(i)
 
         return {
             "found": True,
@@ -509,7 +562,7 @@ def get_lesson_context_by_number(
             "classwork_homework": lesson.get("classwork_homework", []),
             "pages_found_in_sow": pages_found_in_sow,
             "external_resources": external_resources,
-            "exercise_step_indices": sorted(list(exercise_step_indices)),
+            "exercise_step_indices": sorted(exercise_step_indices),
             "book_references": [],
             "sow_format": "legacy"
         }
@@ -528,7 +581,8 @@ def format_lesson_context_for_prompt(context: Dict[str, Any]) -> str:
         lb_ab = context.get("lb_ab_raw", {})
         lesson = context.get("lesson_raw", {})
         selected_sections = context.get("selected_sections")
-        return _format_new_structure_for_prompt(lesson, lb_ab, selected_sections)
+        return _format_new_structure_for_prompt(lesson, lb_ab, selected_sections,
+                                                context.get("selected_exercises"))
 
     if sow_format == "ort":
         return _format_ort_context_for_prompt(context)
@@ -537,110 +591,123 @@ def format_lesson_context_for_prompt(context: Dict[str, Any]) -> str:
     return _format_legacy_context_for_prompt(context)
 
 
+def _partition_resources(resources: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split resources into (audio, video) in one pass; other types are dropped."""
+    audio, video = [], []
+    for r in resources:
+        rtype = r.get("type")
+        if rtype == "audio":
+            audio.append(r)
+        elif rtype == "video":
+            video.append(r)
+    return audio, video
+
+
 def _format_legacy_context_for_prompt(context: Dict[str, Any]) -> str:
+    get = context.get
+    slos = get("student_learning_outcomes")
+    skills = get("skills")
+    teaching_sequence = get("teaching_sequence")
+    cw_hw = get("classwork_homework")
+
     parts = []
-    if context.get("pages_found_in_sow") is False:
-        parts.append("⚠️ No explicit page references found in SOW. Full lesson context provided.")
-        parts.append("")
-    parts.append(f"**{context.get('unit', '')}**")
-    parts.append(f"Lesson {context.get('lesson_number')}: {context.get('lesson_title')}")
-    parts.append(f"Section: {context.get('section_name', '')}")
-    if context.get("student_learning_outcomes"):
-        parts.append(f"\n**Student Learning Outcomes:**")
-        for s in context["student_learning_outcomes"]:
-            parts.append(f"  • {s}")
-    if context.get("skills"):
-        parts.append(f"\n**Skills:** {', '.join(context['skills'])}")
-    if context.get("teaching_sequence"):
-        parts.append(f"\n**Teaching Strategies (in sequence):**")
-        exercise_indices = set(context.get("exercise_step_indices", []))
-        for i, step in enumerate(context["teaching_sequence"]):
-            strategy = step.get("strategy", "")
-            content = step.get("content", "")
-            afl = step.get("afl", [])
+    add = parts.append
+    if get("pages_found_in_sow") is False:
+        add("⚠️ No explicit page references found in SOW. Full lesson context provided.")
+        add("")
+    add(f"**{get('unit', '')}**")
+    add(f"Lesson {get('lesson_number')}: {get('lesson_title')}")
+    add(f"Section: {get('section_name', '')}")
+    if slos:
+        add("\n**Student Learning Outcomes:**")
+        parts.extend(f"  • {s}" for s in slos)
+    if skills:
+        add(f"\n**Skills:** {', '.join(skills)}")
+    if teaching_sequence:
+        add("\n**Teaching Strategies (in sequence):**")
+        exercise_indices = set(get("exercise_step_indices", []))
+        for i, step in enumerate(teaching_sequence):
+            step_get = step.get
+            content = step_get("content", "")
+            afl = step_get("afl", [])
             focus = " ★ TEACHER'S FOCUS" if i in exercise_indices else ""
-            parts.append(f"\n  {i+1}. **{strategy}**{focus}")
+            add(f"\n  {i+1}. **{step_get('strategy', '')}**{focus}")
             if content:
-                indented = "\n".join(f"     {line}" for line in content.split("\n") if line.strip())
-                parts.append(indented)
+                parts.extend(f"     {line}" for line in content.splitlines() if line and not line.isspace())
             if afl:
-                parts.append(f"     ▶ AFL Strategy: {', '.join(afl)}")
-    ext = [r for r in context.get("external_resources", []) if r.get("type") == "audio"]
-    vid = [r for r in context.get("external_resources", []) if r.get("type") == "video"]
+                add(f"     ▶ AFL Strategy: {', '.join(afl)}")
+    ext, vid = _partition_resources(get("external_resources", []))
     if ext:
-        parts.append(f"\n**Audio Resources:**")
-        for r in ext:
-            parts.append(f"  • {r['title']} (reference: {r['reference']})")
+        add("\n**Audio Resources:**")
+        parts.extend(f"  • {r['title']} (reference: {r['reference']})" for r in ext)
     if vid:
-        parts.append(f"\n**Video Resources:**")
-        for r in vid:
-            parts.append(f"  • {r['title']}: {r['reference']}")
-    if context.get("classwork_homework"):
-        parts.append(f"\n**Classwork/Homework:**")
-        for item in context["classwork_homework"]:
-            parts.append(f"  • {item}")
+        add("\n**Video Resources:**")
+        parts.extend(f"  • {r['title']}: {r['reference']}" for r in vid)
+    if cw_hw:
+        add("\n**Classwork/Homework:**")
+        parts.extend(f"  • {item}" for item in cw_hw)
     return "\n".join(parts)
 
 
 def _format_ort_context_for_prompt(context: Dict[str, Any]) -> str:
+    get = context.get
+    ort_pages = get("ort_pages")
+    vocabulary = get("vocabulary")
+    slos = get("student_learning_outcomes")
+    stages = get("reading_stages", {})
+
     parts = []
-    parts.append(f"**{context.get('unit', '')}**")
-    parts.append(f"Lesson {context.get('lesson_number')}: {context.get('lesson_title')}")
-    parts.append(f"ORT Book: {context.get('book_title', '')} — {context.get('story_title', '')}")
-    if context.get("ort_pages"):
-        parts.append(f"Pages: {context['ort_pages']}")
-    if context.get("vocabulary"):
-        parts.append(f"Vocabulary: {', '.join(context['vocabulary'])}")
-    if context.get("student_learning_outcomes"):
-        parts.append("\n**SLOs:**")
-        for s in context["student_learning_outcomes"]:
-            parts.append(f"  • {s}")
-    stages = context.get("reading_stages", {})
+    add = parts.append
+    add(f"**{get('unit', '')}**")
+    add(f"Lesson {get('lesson_number')}: {get('lesson_title')}")
+    add(f"ORT Book: {get('book_title', '')} — {get('story_title', '')}")
+    if ort_pages:
+        add(f"Pages: {ort_pages}")
+    if vocabulary:
+        add(f"Vocabulary: {', '.join(vocabulary)}")
+    if slos:
+        add("\n**SLOs:**")
+        parts.extend(f"  • {s}" for s in slos)
     if stages:
-        parts.append("\n**Reading Stages:**")
+        add("\n**Reading Stages:**")
         for stage_name, stage in stages.items():
-            parts.append(f"\n  [{stage_name.upper().replace('_', ' ')}]")
-            for act in stage.get("activities", []):
-                parts.append(f"  • {act.get('title', '')}: {act.get('description', '')}")
-    ext = [r for r in context.get("external_resources", []) if r.get("type") == "audio"]
-    vid = [r for r in context.get("external_resources", []) if r.get("type") == "video"]
+            add(f"\n  [{stage_name.upper().replace('_', ' ')}]")
+            parts.extend(f"  • {act.get('title', '')}: {act.get('description', '')}" for act in stage.get("activities", []))
+    ext, vid = _partition_resources(get("external_resources", []))
     if ext:
-        parts.append("\n**Audio Resources:**")
-        for r in ext:
-            parts.append(f"  • {r['title']} (reference: {r['reference']})")
+        add("\n**Audio Resources:**")
+        parts.extend(f"  • {r['title']} (reference: {r['reference']})" for r in ext)
     if vid:
-        parts.append("\n**Video Resources:**")
-        for r in vid:
-            parts.append(f"  • {r['title']}: {r['reference']}")
+        add("\n**Video Resources:**")
+        parts.extend(f"  • {r['title']}: {r['reference']}" for r in vid)
     return "\n".join(parts)
 
 
 # ============ BOOK TYPE MAPPING ============
 
+_BOOK_TYPE_TO_DB = {
+    "LB": "learners", "AB": "activity", "TR": "teachers_resource",
+    "ORT": "reading", "CB": "course_book", "WB": "workbook"
+}
+_DB_TO_BOOK_TYPE = {v: k for k, v in _BOOK_TYPE_TO_DB.items()}
+
+
 def map_book_type_to_db(book_type: str) -> str:
-    mapping = {
-        "LB": "learners", "AB": "activity", "TR": "teachers_resource",
-        "ORT": "reading", "CB": "course_book", "WB": "workbook"
-    }
-    return mapping.get(book_type.upper(), book_type.lower())
+    return _BOOK_TYPE_TO_DB.get(book_type.upper(), book_type.lower())
 
 
 def map_db_to_book_type(db_type: str) -> str:
-    mapping = {
-        "learners": "LB", "activity": "AB", "teachers_resource": "TR",
-        "reading": "ORT", "course_book": "CB", "workbook": "WB"
-    }
-    return mapping.get(db_type, db_type.upper())
+    return _DB_TO_BOOK_TYPE.get(db_type, db_type.upper())
 
 
 def get_available_book_types(sow_data: Dict[str, Any]) -> List[str]:
     book_types = set()
-    curriculum = sow_data.get("curriculum", sow_data)
-    for unit in curriculum.get("units", []):
-        for lesson in unit.get("lessons", []):
-            coverage = get_lesson_page_coverage(lesson)
-            book_types.update(coverage.keys())
-    return sorted(list(book_types))
+    for _, lesson in _iter_lessons(sow_data):
+        book_types.update(get_lesson_page_coverage(lesson))
+        # Every coverage code seen — the remaining lessons cannot add any
+        if len(book_types) == len(_COVERAGE_SECTIONS):
+            break
+    return sorted(book_types)
 
 
 # ============ MATH SOW FUNCTIONS ============
@@ -680,11 +747,11 @@ def format_math_unit_for_prompt(unit: Dict[str, Any]) -> str:
 def filter_teaching_sequence_by_pages(steps: list, pages: list) -> list:
     if not pages:
         return []
+    page_set = set(pages)
     matched = []
     for step in steps:
-        content = step.get("content", "")
-        for page in pages:
-            if re.search(rf'\b(?:pg\.?\s*|page\s*|p\.\s*){page}\b', content, re.IGNORECASE):
+        for m in _PAGE_IN_CONTENT_RE.finditer(step.get("content", "")):
+            if int(m.group(1)) in page_set:
                 matched.append(step)
                 break
     return matched
@@ -693,17 +760,13 @@ def filter_teaching_sequence_by_pages(steps: list, pages: list) -> list:
 def extract_pages_with_book_type(text: str) -> List[Tuple[str, int]]:
     if not text:
         return []
-    results = []
-    range_with_book = r'(LB|AB|TR|ORT)\s*(?:pgs?\.?\s*#?\s*)?(\d+)\s*(?:to|–|-)\s*(\d+)'
-    for match in re.finditer(range_with_book, text, re.IGNORECASE):
-        book_type = match.group(1).upper()
-        start, end = int(match.group(2)), int(match.group(3))
-        for page in range(start, end + 1):
-            results.append((book_type, page))
-    single_with_book = r'(LB|AB|TR|ORT)\s*(?:pgs?\.?\s*#?\s*)?(\d+)(?!\s*(?:to|–|-))'
-    for match in re.finditer(single_with_book, text, re.IGNORECASE):
+    results: List[Tuple[str, int]] = []
+    seen: Set[Tuple[str, int]] = set()
+    for match in _PAGES_RE.finditer(text):
         book_type = match.group(1).upper()
-        page = int(match.group(2))
-        if (book_type, page) not in results:
-            results.append((book_type, page))
+        start = int(match.group(2))
+        end = int(match.group(3)) if match.group(3) else start
+        new = [(book_type, page) for page in range(start, end + 1) if (book_type, page) not in seen]
+        seen.update(new)
+        results.extend(new)
     return results
@@ -5,14 +5,48 @@ Uses official SDK patterns from LandingAI documentation
 import os
 import json
 import re
+import asyncio
+import hashlib
+import logging
 from io import BytesIO
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 from pydantic import BaseModel, Field
 
-from landingai_ade import LandingAIADE
+from landingai_ade import LandingAIADE, APIConnectionError, APIStatusError
 from landingai_ade.lib import pydantic_to_json_schema
-from pdf2image import convert_from_path
+
+from src.ingestion.json_cache import read_json_cache, write_json_cache
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses the SDK retries on its own (as it does 5xx and connection
+# errors). _extract gives up with None once these outlast the retries;
+# every other API error is raised.
+_RETRYABLE_STATUS = frozenset({408, 409, 429})
+
+
+# ============ Patterns ============
+
+# Markdown cleanup (_clean_markdown_to_text). Each pattern starts with a literal
+# so re can skip ahead to candidates: _HEADER_RE is ^#+\s* with the line-start
+# check moved after the first '#', _BLANK_LINES_RE is \n{3,}.
+_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\([^)]+\)')
+_HEADER_RE = re.compile(r'#(?<=^#)#*\s*', re.MULTILINE)
+_BOLD_RE = re.compile(r'\*\*([^*]+)\*\*')
+_ITALIC_RE = re.compile(r'\*([^*]+)\*')
+_BLANK_LINES_RE = re.compile(r'\n\n\n+')
+
+# Page references (_parse_page_references), e.g. "pg 44-46", "CB p.12, WB p.5"
+_PAGE_PREFIX_RE = re.compile(r'(pg|page|p\.|pp\.|CB|WB|LB|AB|TR)\s*', re.IGNORECASE)
+_PAGE_SPLIT_RE = re.compile(r'[,\s]+(?:and\s+)?')
+_PAGE_RANGE_RE = re.compile(r'(\d+)\s*-\s*(\d+)')
+_PAGE_NUM_RE = re.compile(r'\d+')
+
+# Wider ranges are treated as typos (e.g. "1-9999") and skipped
+_MAX_PAGE_SPAN = 500
 
 
 # ============ Pydantic Models for Extraction ============
@@ -85,6 +119,47 @@ class SimpleTextExtraction(BaseModel):
     book_text: str = Field(..., description="Full text content including [object: description] for any images")
 
 
+@lru_cache(maxsize=None)
+def _json_schema(model: type) -> Any:
+    """JSON schema for an extraction model, built once per process and shared by all processors."""
+    return pydantic_to_json_schema(model)
+
+
+@lru_cache(maxsize=4096)
+def _parse_page_references_cached(page_str: str) -> Tuple[int, ...]:
+    """Cached body of ADEProcessor._parse_page_references (SOW tables repeat reference strings). Returns a tuple so cached results can't be mutated."""
+    if not page_str:
+        return ()
+    
+    pages = set()
+    
+    # Remove common prefixes
+    cleaned = _PAGE_PREFIX_RE.sub('', page_str)
+    
+    # Split by comma or 'and'
+    parts = _PAGE_SPLIT_RE.split(cleaned)
+    
+    for part in parts:
+        part = part.strip()
+        if '-' in part:
+            # Handle range
+            try:
+                match = _PAGE_RANGE_RE.match(part)
+                if match:
+                    start, end = int(match.group(1)), int(match.group(2))
+                    if end - start <= _MAX_PAGE_SPAN:
+                        pages.update(range(start, end + 1))
+            except ValueError:
+                pass
+        else:
+            # Single page
+            match = _PAGE_NUM_RE.search(part)
+            if match:
+                pages.add(int(match.group()))
+    
+    return tuple(sorted(pages))
+
+
 # ============ ADE Processor Class ============
 
 class ADEProcessor:
@@ -103,33 +178,76 @@ class ADEProcessor:
         if not self.api_key:
             raise ValueError("ADE_API_KEY not found in environment variables")
         
-        self.client = LandingAIADE(apikey=self.api_key)
+        # The SDK retries connection errors and 408/409/429/5xx with backoff
+        self.client = LandingAIADE(apikey=self.api_key, max_retries=int(os.getenv("ADE_MAX_RETRIES", "2")))
         
-        # Pre-compute JSON schemas
-        self.textbook_schema = pydantic_to_json_schema(TextbookExtraction)
-        self.sow_schema = pydantic_to_json_schema(SOWExtraction)
-        self.simple_schema = pydantic_to_json_schema(SimpleTextExtraction)
+        # JSON schemas (cached across instances)
+        self.textbook_schema = _json_schema(TextbookExtraction)
+        self.sow_schema = _json_schema(SOWExtraction)
+        self.simple_schema = _json_schema(SimpleTextExtraction)
+        
+        # Optional on-disk cache of extraction results, keyed by file content + schema
+        cache_dir = os.getenv("ADE_CACHE_DIR")
+        self.cache_dir = Path(cache_dir) if cache_dir else None
     
     def _clean_markdown_to_text(self, markdown_text: str) -> str:
         """Clean markdown formatting while preserving content structure."""
         text = markdown_text
         
         # Convert markdown images to inline format
-        image_pattern = r'!\[([^\]]*)\]\([^)]+\)'
-        text = re.sub(image_pattern, lambda m: f"[object: {m.group(1)}]" if m.group(1) else "[object: image]", text)
+        text = _IMAGE_RE.sub(lambda m: f"[object: {m.group(1)}]" if m.group(1) else "[object: image]", text)
         
         # Remove markdown headers but keep the text
-        text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
+        text = _HEADER_RE.sub('', text)
         
         # Remove bold/italic but keep text
-        text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
-        text = re.sub(r'\*([^*]+)\*', r'\1', text)
+        text = _BOLD_RE.sub(r'\1', text)
+        text = _ITALIC_RE.sub(r'\1', text)
         
         # Clean up excessive whitespace
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = _BLANK_LINES_RE.sub('\n\n', text)
         
         return text.strip()
     
+    def _cache_path(self, file_path: Path, schema: str) -> Optional[Path]:
+        """Cache file for this document + schema, or None when ADE_CACHE_DIR is unset or the file is missing."""
+        if self.cache_dir is None:
+            return None
+        digest = hashlib.sha256()
+        try:
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            # No cache; parse() reports the missing file
+            return None
+        schema_digest = hashlib.sha256(schema.encode("utf-8")).hexdigest()[:12]
+        return self.cache_dir / f"{digest.hexdigest()}.{schema_digest}.json"
+    
+    def _extract(self, schema: str, markdown_content: str) -> Optional[Dict[str, Any]]:
+        """
+        Run extract() on parsed markdown.
+        
+        Returns the extraction dict, or None if it came back empty or failed
+        after the client's retries. Non-retryable API errors (bad key, 4xx)
+        are raised.
+        """
+        try:
+            extract_result = self.client.extract(
+                schema=schema,
+                markdown=BytesIO(markdown_content.encode('utf-8'))
+            )
+        except APIConnectionError as e:
+            logger.error("Extract failed after retries: %s", e)
+            return None
+        except APIStatusError as e:
+            if e.status_code not in _RETRYABLE_STATUS and e.status_code < 500:
+                raise
+            logger.error("Extract failed after retries (HTTP %s): %s", e.status_code, e)
+            return None
+        
+        return getattr(extract_result, 'extraction', None) or None
+    
     def process_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
         """
         Process a PDF file: parse to markdown, then extract structured data.
@@ -140,46 +258,42 @@ class ADEProcessor:
             List of dicts: [{"book_text": "...", "page_no": 1}, ...]
         """
         pdf_path = Path(pdf_path)
-        if not pdf_path.exists():
-            raise FileNotFoundError(f"PDF not found: {pdf_path}")
         
-        print(f"Processing PDF with LandingAI ADE: {pdf_path.name}")
+        logger.info("Processing PDF with LandingAI ADE: %s", pdf_path.name)
+        
+        cache_path = self._cache_path(pdf_path, self.textbook_schema)
+        cached = read_json_cache(cache_path)
+        if cached is not None:
+            logger.info("Using cached extraction (%d pages)", len(cached))
+            return cached
         
         # Step 1: Parse PDF to Markdown
-        print("  Step 1: Parsing PDF to markdown...")
-        parse_result = self.client.parse(document=pdf_path)
+        logger.debug("Step 1: Parsing PDF to markdown")
+        try:
+            parse_result = self.client.parse(document=pdf_path)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"PDF not found: {pdf_path}") from e
         
-        if not hasattr(parse_result, 'markdown') or not parse_result.markdown:
-            print("  WARNING: No markdown from parse!")
+        markdown_content = getattr(parse_result, 'markdown', None)
+        if not markdown_content:
+            logger.warning("No markdown from parse: %s", pdf_path.name)
             return []
         
-        markdown_content = parse_result.markdown
-        print(f"  Got {len(markdown_content)} chars of markdown")
+        logger.debug("Got %d chars of markdown", len(markdown_content))
         
         # Step 2: Extract structured data from markdown
-        print("  Step 2: Extracting structured pages from markdown...")
+        logger.debug("Step 2: Extracting structured pages from markdown")
         
-        try:
-            extract_result = self.client.extract(
-                schema=self.textbook_schema,
-                markdown=BytesIO(markdown_content.encode('utf-8'))
-            )
-            
-            print(f"  Extract result: {type(extract_result)}")
-            
-            if hasattr(extract_result, 'extraction') and extract_result.extraction:
-                pages = extract_result.extraction.get('pages', [])
-                print(f"  Extracted {len(pages)} pages")
-                if pages:
-                    return pages
-            
-        except Exception as e:
-            print(f"  Extract failed: {e}")
-            import traceback
-            traceback.print_exc()
+        extraction = self._extract(self.textbook_schema, markdown_content)
+        if extraction:
+            pages = extraction.get('pages', [])
+            logger.info("Extracted %d pages", len(pages))
+            if pages:
+                write_json_cache(cache_path, pages)
+                return pages
         
         # Fallback: Return cleaned markdown as single page
-        print("  Fallback: Returning cleaned markdown as single page")
+        logger.warning("No pages extracted from %s; returning cleaned markdown as a single page", pdf_path.name)
         cleaned = self._clean_markdown_to_text(markdown_content)
         return [{"book_text": cleaned, "page_no": 1}]
     
@@ -191,34 +305,29 @@ class ADEProcessor:
             Dict: {"book_text": "...", "page_no": 1}
         """
         image_path = Path(image_path)
-        if not image_path.exists():
-            raise FileNotFoundError(f"Image not found: {image_path}")
         
-        print(f"Processing image with LandingAI ADE: {image_path.name}")
+        logger.info("Processing image with LandingAI ADE: %s", image_path.name)
         
         # Step 1: Parse image to markdown
-        parse_result = self.client.parse(document=image_path)
+        try:
+            parse_result = self.client.parse(document=image_path)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Image not found: {image_path}") from e
         
-        if not hasattr(parse_result, 'markdown') or not parse_result.markdown:
+        markdown_content = getattr(parse_result, 'markdown', None)
+        if not markdown_content:
             return {"book_text": "", "page_no": 1}
         
         # Step 2: Extract structured data
-        try:
-            extract_result = self.client.extract(
-                schema=self.simple_schema,
-                markdown=BytesIO(parse_result.markdown.encode('utf-8'))
-            )
-            
-            if hasattr(extract_result, 'extraction') and extract_result.extraction:
-                return {
-                    "book_text": extract_result.extraction.get('book_text', ''),
-                    "page_no": 1
-                }
-        except:
-            pass
+        extraction = self._extract(self.simple_schema, markdown_content)
+        if extraction:
+            return {
+                "book_text": extraction.get('book_text', ''),
+                "page_no": 1
+            }
         
         # Fallback to cleaned markdown
-        return {"book_text": self._clean_markdown_to_text(parse_result.markdown), "page_no": 1}
+        return {"book_text": self._clean_markdown_to_text(markdown_content), "page_no": 1}
     
     def extract_sow(self, file_path: str) -> Dict[str, Any]:
         """
@@ -230,49 +339,69 @@ class ADEProcessor:
             Complete extraction dict with entries, metadata, etc.
         """
         file_path = Path(file_path)
-        if not file_path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
         
-        print(f"Extracting SOW with LandingAI ADE: {file_path.name}")
+        logger.info("Extracting SOW with LandingAI ADE: %s", file_path.name)
+        
+        cache_path = self._cache_path(file_path, self.sow_schema)
+        cached = read_json_cache(cache_path)
+        if cached is not None:
+            logger.info("Using cached extraction")
+            return cached
         
         # Step 1: Parse to markdown
-        print("  Step 1: Parsing SOW to markdown...")
-        parse_result = self.client.parse(document=file_path)
+        logger.debug("Step 1: Parsing SOW to markdown")
+        try:
+            parse_result = self.client.parse(document=file_path)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"File not found: {file_path}") from e
         
-        if not hasattr(parse_result, 'markdown') or not parse_result.markdown:
-            print("  ERROR: No markdown from parse!")
+        markdown_content = getattr(parse_result, 'markdown', None)
+        if not markdown_content:
+            logger.error("No markdown from parse: %s", file_path.name)
             return {"error": "No markdown from parse", "entries": []}
         
-        markdown_content = parse_result.markdown
-        print(f"  Got {len(markdown_content)} chars of markdown")
+        logger.debug("Got %d chars of markdown", len(markdown_content))
         
         # Step 2: Extract structured data
-        print("  Step 2: Extracting structured entries from markdown...")
+        logger.debug("Step 2: Extracting structured entries from markdown")
         
-        try:
-            extract_result = self.client.extract(
-                schema=self.sow_schema,
-                markdown=BytesIO(markdown_content.encode('utf-8'))
-            )
-            
-            print(f"  Extract result type: {type(extract_result)}")
+        extraction = self._extract(self.sow_schema, markdown_content)
+        if extraction:
+            logger.debug("Extraction: %s", extraction)
             
-            if hasattr(extract_result, 'extraction') and extract_result.extraction:
-                extraction = extract_result.extraction
-                print(f"  Extraction: {extraction}")
-                
-                # Return complete extraction dict
-                return extraction
-        
-        except Exception as e:
-            print(f"  ERROR in extract: {e}")
-            import traceback
-            traceback.print_exc()
+            # Return complete extraction dict
+            write_json_cache(cache_path, extraction)
+            return extraction
         
         # Fallback: Return empty structure
-        print("  Returning empty extraction")
+        logger.error("SOW extraction failed for %s; returning empty extraction", file_path.name)
         return {"entries": [], "error": "Extraction failed"}
     
+    def process_many(self, pdf_paths: List[str], max_workers: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Process several PDFs concurrently. The ADE calls are network-bound, so threads suffice.
+        
+        Workers default to ADE_MAX_WORKERS (8), capped at the number of paths.
+        
+        Returns:
+            One process_pdf result per path, in input order
+        """
+        if not pdf_paths:
+            return []
+        if max_workers is None:
+            max_workers = int(os.getenv("ADE_MAX_WORKERS", "8"))
+        max_workers = max(1, min(max_workers, len(pdf_paths)))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(self.process_pdf, pdf_paths))
+    
+    async def process_pdf_async(self, pdf_path: str) -> List[Dict[str, Any]]:
+        """process_pdf in a worker thread, so the event loop keeps serving requests during the ADE round trips."""
+        return await asyncio.to_thread(self.process_pdf, pdf_path)
+    
+    async def extract_sow_async(self, file_path: str) -> Dict[str, Any]:
+        """extract_sow in a worker thread (see process_pdf_async)."""
+        return await asyncio.to_thread(self.extract_sow, file_path)
+    
     def _parse_page_references(self, page_str: str) -> List[int]:
         """
         Parse page reference strings into list of integers.
@@ -282,35 +411,7 @@ class ADEProcessor:
             "CB p.12, WB p.5" -> [12, 5]
             "pages 10, 12, 15" -> [10, 12, 15]
         """
-        if not page_str:
-            return []
-        
-        pages = []
-        
-        # Remove common prefixes
-        cleaned = re.sub(r'(pg|page|p\.|pp\.|CB|WB|LB|AB|TR)\s*', '', page_str, flags=re.IGNORECASE)
-        
-        # Split by comma or 'and'
-        parts = re.split(r'[,\s]+(?:and\s+)?', cleaned)
-        
-        for part in parts:
-            part = part.strip()
-            if '-' in part:
-                # Handle range
-                try:
-                    match = re.match(r'(\d+)\s*-\s*(\d+)', part)
-                    if match:
-                        start, end = int(match.group(1)), int(match.group(2))
-                        pages.extend(range(start, end + 1))
-                except ValueError:
-                    pass
-            else:
-                # Single page
-                match = re.search(r'\d+', part)
-                if match:
-                    pages.append(int(match.group()))
-        
-        return sorted(list(set(pages)))
+        return list(_parse_page_references_cached(page_str or ""))
 
 
 # Lazy singleton - only initialize when needed
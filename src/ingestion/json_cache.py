@@ -0,0 +1,36 @@
+"""
+JSON Cache - On-disk JSON cache entries shared by the ADE and Vision LLM caches
+"""
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def read_json_cache(cache_path: Optional[Path]) -> Any:
+    """Cached result, or None on a miss (unreadable entries count as misses)"""
+    if cache_path is None or not cache_path.is_file():
+        return None
+    try:
+        return json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable cache entry %s: %s", cache_path, e)
+        return None
+
+
+def write_json_cache(cache_path: Optional[Path], result: Any) -> None:
+    """Store result atomically (write a per-writer temp file, then rename over the entry)"""
+    if cache_path is None:
+        return
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps(result), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning("Could not write cache entry %s: %s", cache_path, e)
+        tmp_path.unlink(missing_ok=True)
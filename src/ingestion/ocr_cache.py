@@ -0,0 +1,24 @@
+"""
+OCR Cache - On-disk cache of Vision LLM results, keyed by page image + prompt + model
+(entries are read and written with src.ingestion.json_cache)
+"""
+import os
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+# Opt-in: results are cached only when LPG_OCR_CACHE_DIR is set (like ADE_CACHE_DIR)
+_cache_dir = os.getenv("LPG_OCR_CACHE_DIR")
+_CACHE_DIR = Path(_cache_dir) if _cache_dir else None
+
+
+def ocr_cache_path(image_base64: str, prompt: str, model: str) -> Optional[Path]:
+    """Cache file for this (image, prompt, model), or None when LPG_OCR_CACHE_DIR is unset"""
+    if _CACHE_DIR is None:
+        return None
+    digest = hashlib.sha256()
+    for part in (image_base64, prompt, model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return _CACHE_DIR / f"{digest.hexdigest()}.json"
+
@@ -0,0 +1,45 @@
+"""
+Page Images - Rendering and encoding settings shared by the Vision LLM ingestion paths
+"""
+import os
+import io
+import base64
+
+from PIL import Image
+
+# pdftoppm processes used to rasterize a PDF (pages are split between them)
+RASTER_THREADS = max(1, (os.cpu_count() or 1) - 1)
+
+# File format pdftoppm renders pages to: lossless, but compressed — raw PPM is
+# ~10 MB per page at 200 dpi, which sits in RAM when the temp dir is on tmpfs
+RENDER_FORMAT = "png"
+
+# Vision LLM requests kept in flight at once while processing a PDF
+VISION_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "8"))
+
+# Page images go to the Vision LLM as JPEG (much smaller than PNG);
+# VISION_IMAGE_PNG=1 switches back to lossless PNG
+_IMAGE_FORMAT = "PNG" if os.getenv("VISION_IMAGE_PNG") == "1" else "JPEG"
+IMAGE_MIME = f"image/{_IMAGE_FORMAT.lower()}"
+
+
+def image_to_base64(image: Image.Image) -> str:
+    """Convert PIL Image to base64 string (encoded as IMAGE_MIME)"""
+    buffer = io.BytesIO()
+    if _IMAGE_FORMAT == "JPEG":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=85)
+    else:
+        image.save(buffer, format="PNG")
+    # getbuffer() hands base64 a view of the encoded bytes instead of a copy
+    return base64.b64encode(buffer.getbuffer()).decode("ascii")
+
+
+def page_file_to_base64(image_path: str) -> str:
+    """Encode a rendered page file, then delete it (only in-flight pages stay in memory or on disk)"""
+    with Image.open(image_path) as image:
+        image.load()
+        image_base64 = image_to_base64(image)
+    os.unlink(image_path)
+    return image_base64
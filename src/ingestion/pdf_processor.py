@@ -3,17 +3,24 @@ PDF Processor - Extract text from textbook pages using Vision LLM
 """
 import os
 import json
-import base64
+import hashlib
 import tempfile
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 from pathlib import Path
 
 import pdfplumber
 from pdf2image import convert_from_path
-from PIL import Image
 import httpx
 
 from src.prompts.templates import PDF_OCR_PROMPT
+from src.ingestion.ocr_cache import ocr_cache_path
+from src.ingestion.json_cache import read_json_cache, write_json_cache
+from src.ingestion.page_images import (
+    RASTER_THREADS, RENDER_FORMAT, VISION_CONCURRENCY, IMAGE_MIME, page_file_to_base64
+)
 
 
 class PDFProcessor:
@@ -24,13 +31,6 @@ class PDFProcessor:
         self.base_url = "https://openrouter.ai/api/v1"
         self.model = "openai/gpt-4.1"  # Vision-capable model
     
-    def _image_to_base64(self, image: Image.Image) -> str:
-        """Convert PIL Image to base64 string"""
-        import io
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-    
     def _extract_text_pdfplumber(self, pdf_path: str, page_num: int) -> str:
         """Fallback: Extract text using pdfplumber"""
         try:
@@ -42,8 +42,30 @@ class PDFProcessor:
             print(f"pdfplumber extraction failed: {e}")
         return ""
     
-    def _call_vision_llm(self, image_base64: str, page_num: int = 1) -> Dict[str, Any]:
-        """Call OpenRouter Vision LLM for OCR"""
+    def _call_vision_llm(self, image_base64: str, page_num: int = 1, client: Optional[httpx.Client] = None) -> Dict[str, Any]:
+        """Call OpenRouter Vision LLM for OCR (over `client` if given, else a one-off client)"""
+        return self._page_from_ocr(self._ocr_image(image_base64, client), page_num)
+    
+    def _page_from_ocr(self, parsed: Optional[Dict[str, Any]], page_num: int) -> Dict[str, Any]:
+        """Ensure correct format {book_text, page_no}; an empty page when OCR failed"""
+        if parsed is None:
+            return {
+                "book_text": "",
+                "page_no": page_num
+            }
+        return {
+            "book_text": parsed.get("book_text", ""),
+            "page_no": parsed.get("page_no", page_num)
+        }
+    
+    def _ocr_image(self, image_base64: str, client: Optional[httpx.Client] = None) -> Optional[Dict[str, Any]]:
+        """OCR JSON returned by the Vision LLM for one page image, or None if the call failed"""
+        # Identical page images are answered from the on-disk OCR cache (when enabled)
+        cache_path = ocr_cache_path(image_base64, PDF_OCR_PROMPT, self.model)
+        parsed = read_json_cache(cache_path)
+        if parsed is not None:
+            return parsed
+        
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -62,7 +84,7 @@ class PDFProcessor:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
+                                "url": f"data:{IMAGE_MIME};base64,{image_base64}"
                             }
                         }
                     ]
@@ -72,8 +94,8 @@ class PDFProcessor:
         }
         
         try:
-            with httpx.Client(timeout=60.0) as client:
-                response = client.post(
+            with (httpx.Client(timeout=60.0) if client is None else nullcontext(client)) as http:
+                response = http.post(
                     f"{self.base_url}/chat/completions",
                     headers=headers,
                     json=payload
@@ -91,19 +113,46 @@ class PDFProcessor:
                         content = content[4:]
                 
                 parsed = json.loads(content.strip())
+                if not isinstance(parsed, dict):
+                    raise ValueError(f"expected a JSON object, got {type(parsed).__name__}")
                 
-                # Ensure correct format {book_text, page_no}
-                return {
-                    "book_text": parsed.get("book_text", ""),
-                    "page_no": parsed.get("page_no", page_num)
-                }
+                write_json_cache(cache_path, parsed)
+                return parsed
                 
         except Exception as e:
             print(f"Vision LLM call failed: {e}")
-            return {
-                "book_text": "",
-                "page_no": page_num
-            }
+            return None
+    
+    def _ocr_pages(self, pages: Iterable[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        """OCR (page_num, rendered page file) pairs concurrently over one pooled client; results keep page order.
+        
+        Identical page images (blank pages, repeated template pages) are sent to the
+        Vision LLM once per run; repeats reuse that result with their own page_no fallback.
+        """
+        ocr_by_image: Dict[str, Future] = {}
+        ocr_by_image_lock = threading.Lock()
+        
+        with httpx.Client(timeout=60.0, limits=httpx.Limits(max_connections=VISION_CONCURRENCY)) as client, \
+                ThreadPoolExecutor(max_workers=VISION_CONCURRENCY) as pool:
+            def ocr(page_num: int, image_path: str) -> Dict[str, Any]:
+                print(f"  Processing page {page_num}...")
+                image_base64 = page_file_to_base64(image_path)
+                key = hashlib.blake2b(image_base64.encode("ascii"), digest_size=16).hexdigest()
+                with ocr_by_image_lock:
+                    shared = ocr_by_image.get(key)
+                    if shared is None:
+                        ocr_by_image[key] = owned = Future()
+                if shared is not None:
+                    return self._page_from_ocr(shared.result(), page_num)
+                try:
+                    parsed = self._ocr_image(image_base64, client)
+                except BaseException as e:
+                    owned.set_exception(e)
+                    raise
+                owned.set_result(parsed)
+                return self._page_from_ocr(parsed, page_num)
+            futures = [pool.submit(ocr, page_num, image_path) for page_num, image_path in pages]
+            return [future.result() for future in futures]
     
     def process_pdf(
         self, 
@@ -126,28 +175,33 @@ class PDFProcessor:
         if not pdf_path.exists():
             raise FileNotFoundError(f"PDF not found: {pdf_path}")
         
-        # Convert PDF to images
+        # Convert PDF to images (rendered to files, opened one page at a time)
         print(f"Converting PDF to images: {pdf_path.name}")
-        images = convert_from_path(str(pdf_path), dpi=150)
-        
-        total_pages = len(images)
-        print(f"Processing {total_pages} pages...")
-        
-        for page_num, image in enumerate(images, start=1):
-            print(f"  Processing page {page_num}/{total_pages}...")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_paths = convert_from_path(
+                str(pdf_path),
+                dpi=150,
+                thread_count=RASTER_THREADS,
+                output_folder=temp_dir,
+                fmt=RENDER_FORMAT,
+                paths_only=True
+            )
+            
+            total_pages = len(image_paths)
+            print(f"Processing {total_pages} pages...")
             
             if use_vision:
-                # Use Vision LLM for OCR
-                image_base64 = self._image_to_base64(image)
-                ocr_result = self._call_vision_llm(image_base64, page_num)
-                pages_data.append(ocr_result)
+                # Use Vision LLM for OCR, several pages at a time
+                pages_data = self._ocr_pages(enumerate(image_paths, start=1))
             else:
-                # Fallback to pdfplumber
-                text = self._extract_text_pdfplumber(str(pdf_path), page_num)
-                pages_data.append({
-                    "book_text": text,
-                    "page_no": page_num
-                })
+                for page_num in range(1, total_pages + 1):
+                    print(f"  Processing page {page_num}/{total_pages}...")
+                    # Fallback to pdfplumber
+                    text = self._extract_text_pdfplumber(str(pdf_path), page_num)
+                    pages_data.append({
+                        "book_text": text,
+                        "page_no": page_num
+                    })
         
         print(f"Completed processing {total_pages} pages")
         return pages_data
@@ -171,28 +225,29 @@ class PDFProcessor:
         if not pdf_path.exists():
             raise FileNotFoundError(f"PDF not found: {pdf_path}")
         
-        # Convert specific pages to images
-        images = convert_from_path(
-            str(pdf_path),
-            dpi=150,
-            first_page=start_page,
-            last_page=end_page
-        )
-        
-        for idx, image in enumerate(images):
-            page_num = start_page + idx
-            print(f"Processing page {page_num}...")
+        # Convert specific pages to images (rendered to files, opened one page at a time)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_paths = convert_from_path(
+                str(pdf_path),
+                dpi=150,
+                first_page=start_page,
+                last_page=end_page,
+                thread_count=RASTER_THREADS,
+                output_folder=temp_dir,
+                fmt=RENDER_FORMAT,
+                paths_only=True
+            )
             
             if use_vision:
-                image_base64 = self._image_to_base64(image)
-                ocr_result = self._call_vision_llm(image_base64, page_num)
-                pages_data.append(ocr_result)
+                pages_data = self._ocr_pages(enumerate(image_paths, start=start_page))
             else:
-                text = self._extract_text_pdfplumber(str(pdf_path), page_num)
-                pages_data.append({
-                    "book_text": text,
-                    "page_no": page_num
-                })
+                for page_num in range(start_page, start_page + len(image_paths)):
+                    print(f"Processing page {page_num}...")
+                    text = self._extract_text_pdfplumber(str(pdf_path), page_num)
+                    pages_data.append({
+                        "book_text": text,
+                        "page_no": page_num
+                    })
         
         return pages_data
 
@@ -3,9 +3,11 @@ SOW Parser - Extract structured data from Scheme of Work documents
 """
 import os
 import json
-import base64
 import re
-from typing import List, Dict, Any
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional
 from pathlib import Path
 
 from pdf2image import convert_from_path
@@ -13,6 +15,26 @@ from PIL import Image
 import httpx
 
 from src.prompts.templates import SOW_PARSER_PROMPT
+from src.ingestion.ocr_cache import ocr_cache_path
+from src.ingestion.json_cache import read_json_cache, write_json_cache
+from src.ingestion.page_images import (
+    RASTER_THREADS, RENDER_FORMAT, VISION_CONCURRENCY, IMAGE_MIME, image_to_base64, page_file_to_base64
+)
+
+# Page reference cleanup used by _expand_page_range
+_PAGE_PREFIX_RE = re.compile(r'(pg|page|p\.|pp\.)\s*', re.IGNORECASE)
+
+
+class _KeepDigits(dict):
+    """str.translate table that deletes non-decimal characters (same result as re.sub(r'\\D', '', s))"""
+    
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        kept = codepoint if chr(codepoint).isdecimal() else None
+        self[codepoint] = kept
+        return kept
+
+
+_KEEP_DIGITS = _KeepDigits()
 
 
 class SOWParser:
@@ -23,13 +45,6 @@ class SOWParser:
         self.base_url = "https://openrouter.ai/api/v1"
         self.model = "openai/gpt-4.1"
     
-    def _image_to_base64(self, image: Image.Image) -> str:
-        """Convert PIL Image to base64 string"""
-        import io
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-    
     def _expand_page_range(self, page_str: str) -> List[int]:
         """
         Expand page references to list of integers
@@ -38,10 +53,13 @@ class SOWParser:
             "12, 15, 18" -> [12, 15, 18]
             "pg 23-25, 30" -> [23, 24, 25, 30]
         """
+        if not page_str:
+            return []
+        
         pages = []
         
         # Remove common prefixes
-        cleaned = re.sub(r'(pg|page|p\.|pp\.)\s*', '', page_str, flags=re.IGNORECASE)
+        cleaned = _PAGE_PREFIX_RE.sub('', page_str)
         
         # Split by comma
         parts = cleaned.split(',')
@@ -52,24 +70,29 @@ class SOWParser:
                 # Handle range
                 try:
                     start, end = part.split('-')
-                    start = int(re.sub(r'\D', '', start))
-                    end = int(re.sub(r'\D', '', end))
+                    start = int(start.translate(_KEEP_DIGITS))
+                    end = int(end.translate(_KEEP_DIGITS))
                     pages.extend(range(start, end + 1))
                 except ValueError:
                     pass
             else:
                 # Single page
                 try:
-                    page = int(re.sub(r'\D', '', part))
+                    page = int(part.translate(_KEEP_DIGITS))
                     if page > 0:
                         pages.append(page)
                 except ValueError:
                     pass
         
-        return sorted(list(set(pages)))
+        return sorted(set(pages))
     
-    def _call_vision_llm(self, image_base64: str) -> Dict[str, Any]:
-        """Call OpenRouter Vision LLM for SOW parsing"""
+    def _call_vision_llm(self, image_base64: str, client: Optional[httpx.Client] = None) -> Dict[str, Any]:
+        """Call OpenRouter Vision LLM for SOW parsing (over `client` if given, else a one-off client)"""
+        cache_path = ocr_cache_path(image_base64, SOW_PARSER_PROMPT, self.model)
+        cached = read_json_cache(cache_path)
+        if cached is not None:
+            return cached
+        
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -88,7 +111,7 @@ class SOWParser:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
+                                "url": f"data:{IMAGE_MIME};base64,{image_base64}"
                             }
                         }
                     ]
@@ -98,8 +121,8 @@ class SOWParser:
         }
         
         try:
-            with httpx.Client(timeout=120.0) as client:
-                response = client.post(
+            with (httpx.Client(timeout=120.0) if client is None else nullcontext(client)) as http:
+                response = http.post(
                     f"{self.base_url}/chat/completions",
                     headers=headers,
                     json=payload
@@ -115,7 +138,9 @@ class SOWParser:
                     if content.startswith("json"):
                         content = content[4:]
                 
-                return json.loads(content.strip())
+                parsed = json.loads(content.strip())
+                write_json_cache(cache_path, parsed)
+                return parsed
                 
         except json.JSONDecodeError as e:
             print(f"JSON parsing failed: {e}")
@@ -140,19 +165,35 @@ class SOWParser:
         if not pdf_path.exists():
             raise FileNotFoundError(f"PDF not found: {pdf_path}")
         
-        # Convert PDF to images
+        # Convert PDF to images (rendered to files, opened one page at a time)
         print(f"Converting SOW PDF to images: {pdf_path.name}")
-        images = convert_from_path(str(pdf_path), dpi=200)
-        
-        total_pages = len(images)
-        print(f"Processing {total_pages} SOW pages...")
-        
-        for page_num, image in enumerate(images, start=1):
-            print(f"  Parsing SOW page {page_num}/{total_pages}...")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_paths = convert_from_path(
+                str(pdf_path),
+                dpi=200,
+                thread_count=RASTER_THREADS,
+                output_folder=temp_dir,
+                fmt=RENDER_FORMAT,
+                paths_only=True
+            )
             
-            image_base64 = self._image_to_base64(image)
-            result = self._call_vision_llm(image_base64)
+            total_pages = len(image_paths)
+            print(f"Processing {total_pages} SOW pages...")
             
+            # Pages are sent to the Vision LLM several at a time over one pooled
+            # client; results are consumed in page order so entries stay ordered
+            with httpx.Client(timeout=120.0, limits=httpx.Limits(max_connections=VISION_CONCURRENCY)) as client, \
+                    ThreadPoolExecutor(max_workers=VISION_CONCURRENCY) as pool:
+                def parse_page(page_num: int, image_path: str) -> Dict[str, Any]:
+                    print(f"  Parsing SOW page {page_num}/{total_pages}...")
+                    return self._call_vision_llm(page_file_to_base64(image_path), client)
+                futures = [
+                    pool.submit(parse_page, page_num, image_path)
+                    for page_num, image_path in enumerate(image_paths, start=1)
+                ]
+                results = [future.result() for future in futures]
+        
+        for result in results:
             entries = result.get("entries", [])
             
             # Post-process entries
@@ -188,7 +229,7 @@ class SOWParser:
         print(f"Parsing SOW image: {image_path.name}")
         
         image = Image.open(image_path)
-        image_base64 = self._image_to_base64(image)
+        image_base64 = image_to_base64(image)
         result = self._call_vision_llm(image_base64)
         
         entries = result.get("entries", [])